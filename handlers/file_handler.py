@@ -1,4 +1,5 @@
 """Handle file uploads including rclone config file detection."""
+import asyncio
 import logging
 import os
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -17,8 +18,20 @@ logger = logging.getLogger(__name__)
 file_manager = FileManager()
 processor = FFmpegProcessor()
 
+# Updates are handled concurrently; one lock per user keeps that user's files
+# processed one at a time in the order they were sent (asyncio.Lock is FIFO),
+# so videos land in the merge queue in sending order
+_user_locks = {}
+
 async def handle_files(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle all file uploads and process based on operation."""
+    lock = _user_locks.setdefault(update.effective_user.id, asyncio.Lock())
+    async with lock:
+        await _handle_files(update, context)
+
+
+async def _handle_files(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Process one file or text message for the user's selected operation."""
     try:
         user_id = update.effective_user.id
         
@@ -26,6 +26,21 @@ def check_rclone_installed():
         return False
 
 
+def get_rclone_remote(user_id: int):
+    """Return (conf_path, drive_name) for the user's first rclone remote, or None if unavailable."""
+    if not check_rclone_installed():
+        return None
+    
+    conf_path = f"./userdata/{user_id}/rclone.conf"
+    try:
+        with open(conf_path, 'r') as f:
+            match = re.search(r'\[([^\]]+)\]', f.read())
+    except (OSError, ValueError):
+        return None
+    
+    return (conf_path, match.group(1)) if match else None
+
+
 class Status:
     """Status tracking for rclone uploads."""
     Tasks = []
@@ -140,7 +155,9 @@ async def rclone_driver(status_msg, user_id: int, filepath: str, filename: str =
         dict: Status with success flag and details
     """
     try:
-        if not check_rclone_installed():
+        remote = await asyncio.to_thread(get_rclone_remote, user_id)
+        
+        if remote is None and not check_rclone_installed():
             logger.error("Rclone binary not installed on server")
             try:
                 await status_msg.edit_text(
@@ -153,41 +170,20 @@ async def rclone_driver(status_msg, user_id: int, filepath: str, filename: str =
                 pass
             return {"success": False, "error": "rclone not installed on server"}
         
-        # Get rclone config path from user's config
-        conf_path = f"./userdata/{user_id}/rclone.conf"
-        
-        if not os.path.exists(conf_path):
-            logger.error(f"Rclone config not found at {conf_path}")
+        if remote is None:
+            logger.error(f"No usable rclone config for user {user_id}")
             try:
                 await status_msg.edit_text(
                     "❌ RCLONE CONFIG NOT FOUND\n━━━━━━━━━━━━━━━━━━\n\n"
                     "Please upload your rclone.conf file first.\n"
+                    "It must define at least one remote.\n"
                     "Go to Upload Mode → Rclone"
                 )
             except:
                 pass
             return {"success": False, "error": "Rclone config not found"}
         
-        # Read config to get drive name
-        try:
-            with open(conf_path, 'r') as f:
-                content = f.read()
-            
-            # Extract first remote name from config
-            match = re.search(r'\[([^\]]+)\]', content)
-            if not match:
-                raise ValueError("No remotes found in rclone.conf")
-            
-            drive_name = match.group(1)
-        except Exception as e:
-            logger.error(f"Error reading rclone config: {e}")
-            try:
-                await status_msg.edit_text(
-                    f"❌ Invalid rclone config:\n{str(e)}"
-                )
-            except:
-                pass
-            return {"success": False, "error": "Invalid rclone config"}
+        conf_path, drive_name = remote
         
         # Check if file exists
         if not os.path.exists(filepath):
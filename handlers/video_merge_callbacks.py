@@ -7,6 +7,28 @@ from keyboards.main_keyboard import get_telegram_format_keyboard
 
 logger = logging.getLogger(__name__)
 
+# Static keyboards, built once at import instead of on every callback
+_SEND_VIDEO_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("⬅️ Back", callback_data="merge_menu")
+]])
+
+_RENAME_CANCEL_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton("❌ Cancel", callback_data="merge_confirm_back")
+]])
+
+_FORMAT_KEYBOARD = get_telegram_format_keyboard()
+
+_RENAME_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("📌 Default", callback_data="merge_use_default"),
+        InlineKeyboardButton("✏️ Rename", callback_data="merge_ask_rename")
+    ],
+    [
+        InlineKeyboardButton("⬅️ Back", callback_data="merge_menu"),
+        InlineKeyboardButton("❌ Cancel", callback_data="merge_menu")
+    ]
+])
+
 
 async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Main handler for video merge callbacks."""
@@ -30,13 +52,15 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
                      "Supported formats: mp4, mkv, mov, webm\n"
                      "Max file size: 4GB\n\n"
                      "Type /start to cancel",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("⬅️ Back", callback_data="merge_menu")
-                ]])
+                reply_markup=_SEND_VIDEO_KEYBOARD
             )
         
         elif callback_data == "merge_clear":
             queue = get_or_create_queue(user_id)
+            # Clearing mid-merge would delete inputs ffmpeg hasn't opened yet
+            if queue.merging:
+                await query.answer("⏳ Merge already running!", show_alert=True)
+                return
             queue.clear_all()
             await query.answer("Queue cleared", show_alert=False)
             await show_merge_menu(update, context, edit=True)
@@ -50,7 +74,7 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
             upload_mode = context.user_data.get("upload_mode")
             if not upload_mode:
                 await query.answer("❌ Please select Upload Mode first!", show_alert=True)
-                logger.warning(f"User {user_id} attempted merge without selecting upload mode")
+                logger.warning("User %s attempted merge without selecting upload mode", user_id)
                 return
             
             if upload_mode.get("engine") == "telegram":
@@ -60,10 +84,10 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
                          "🎥 Video: Sends as playable video file\n"
                          "📁 Document: Sends as generic file\n\n"
                          "Select your preferred format:",
-                    reply_markup=get_telegram_format_keyboard()
+                    reply_markup=_FORMAT_KEYBOARD
                 )
                 context.user_data["awaiting_merge_format"] = True
-                logger.info(f"User {user_id} shown format selection for merge")
+                logger.info("User %s shown format selection for merge", user_id)
                 return
             elif upload_mode.get("engine") == "rclone":
                 await _show_rename_options(query, user_id)
@@ -90,11 +114,9 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
                      "• my_video (extension auto-added)\n"
                      "• birthday_celebration.mp4\n\n"
                      "Don't worry about the extension, we'll handle it!",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("❌ Cancel", callback_data="merge_confirm_back")
-                ]])
+                reply_markup=_RENAME_CANCEL_KEYBOARD
             )
-            logger.info(f"User {user_id} started rename process")
+            logger.info("User %s started rename process", user_id)
         
         elif callback_data == "merge_confirm_back":
             """User cancelled rename, go back to rename options"""
@@ -111,7 +133,7 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
             
             # Show rename options after format selection
             await _show_rename_options(query, user_id)
-            logger.info(f"User {user_id} selected Video format for merge")
+            logger.info("User %s selected Video format for merge", user_id)
         
         elif callback_data == "telegram_format_document":
             """User selected Document format for Telegram merge"""
@@ -120,10 +142,10 @@ async def handle_merge_callbacks(update: Update, context: ContextTypes.DEFAULT_T
             
             # Show rename options after format selection
             await _show_rename_options(query, user_id)
-            logger.info(f"User {user_id} selected Document format for merge")
+            logger.info("User %s selected Document format for merge", user_id)
         
     except Exception as e:
-        logger.error(f"Error in merge callback: {e}")
+        logger.error("Error in merge callback: %s", e)
         await query.answer(f"Error: {str(e)}", show_alert=True)
 
 
@@ -134,15 +156,6 @@ async def _show_rename_options(query, user_id):
              "How would you like to name the merged file?\n\n"
              "📌 Default: merged_video.mp4\n"
              "✏️ Rename: Choose a custom name",
-        reply_markup=InlineKeyboardMarkup([
-            [
-                InlineKeyboardButton("📌 Default", callback_data="merge_use_default"),
-                InlineKeyboardButton("✏️ Rename", callback_data="merge_ask_rename")
-            ],
-            [
-                InlineKeyboardButton("⬅️ Back", callback_data="merge_menu"),
-                InlineKeyboardButton("❌ Cancel", callback_data="merge_menu")
-            ]
-        ])
+        reply_markup=_RENAME_KEYBOARD
     )
-    logger.info(f"User {user_id} shown rename options")
+    logger.info("User %s shown rename options", user_id)
@@ -25,7 +25,7 @@ async def handle_merge_video_upload(update: Update, context: ContextTypes.DEFAUL
         file_name = file_info.file_name or f"video_{len(queue.videos) + 1}.mp4"
         
         # Create metadata
-        metadata = VideoMetadata(
+        metadata = await VideoMetadata.from_file(
             msg_id=update.message.message_id,
             file_name=file_name,
             file_path=file_path
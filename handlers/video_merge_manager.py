@@ -1,18 +1,17 @@
 """Advanced video merge queue management system with real-time validation and settings."""
+import asyncio
 import logging
 import os
 from datetime import datetime
+from pathlib import Path
 from typing import Optional, Dict, List, Any
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from utils.file_manager import FileManager
-from utils.ffmpeg_processor import FFmpegProcessor
 import json
-import subprocess
 
 logger = logging.getLogger(__name__)
 file_manager = FileManager()
-processor = FFmpegProcessor()
 
 # Queue database - stores merge state per user with message ID for editing
 MERGE_QUEUE_DB: Dict[int, Dict[str, Any]] = {}
@@ -25,87 +24,87 @@ class VideoMetadata:
         self.msg_id = msg_id
         self.file_name = file_name
         self.file_path = file_path
+        # Absolute forward-slash path, precomputed for ffmpeg concat lists
+        self.abs_posix_path = Path(os.path.abspath(file_path)).as_posix()
         self.size = file_manager.get_file_size(file_path)
-        self.duration = processor.get_video_duration(file_path)
         
-        self.resolution = self._get_resolution()
-        self.fps = self._get_fps()
-        self.codec = self._get_codec()
-        self.has_audio = self._check_audio()
+        # Filled in by apply_probe() from a single ffprobe run; these are the
+        # fallbacks used when the file can't be probed
+        self.duration = 0.0
+        self.resolution = (1920, 1080)
+        self.fps = 30.0
+        self.codec = "h264"
+        self.has_audio = True
+        self.audio_codec: Optional[str] = None
+        self.sample_rate: Optional[int] = None
+        self.pix_fmt: Optional[str] = None
         self.added_time = datetime.now()
+    
+    @staticmethod
+    async def from_file(msg_id: int, file_name: str, file_path: str) -> 'VideoMetadata':
+        """Build metadata for a file with one async `ffprobe -show_streams -show_format` call."""
+        meta = await asyncio.to_thread(VideoMetadata, msg_id, file_name, file_path)
         
-    def _get_resolution(self) -> tuple:
-        """Extract resolution using ffprobe."""
-        try:
-            cmd = [
-                "ffprobe", "-v", "error", "-select_streams", "v:0",
-                "-show_entries", "stream=width,height",
-                "-of", "json", self.file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            data = json.loads(result.stdout)
-            if data.get("streams"):
-                stream = data["streams"][0]
-                width = stream.get("width", 1920)
-                height = stream.get("height", 1080)
-                return (width, height)
-            return (1920, 1080)
-        except Exception as e:
-            logger.warning(f"Could not get resolution: {e}")
-            return (1920, 1080)
-    
-    def _get_fps(self) -> float:
-        """Extract FPS using ffprobe."""
+        probe = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", file_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
         try:
-            cmd = [
-                "ffprobe", "-v", "error", "-select_streams", "v:0",
-                "-show_entries", "stream=r_frame_rate",
-                "-of", "json", self.file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            data = json.loads(result.stdout)
-            if data.get("streams"):
-                fps_str = data["streams"][0].get("r_frame_rate", "30/1")
-                if "/" in fps_str:
-                    num, den = fps_str.split("/")
-                    return float(num) / float(den)
-                return float(fps_str)
-            return 30.0
-        except Exception as e:
-            logger.warning(f"Could not get FPS: {e}")
-            return 30.0
-    
-    def _get_codec(self) -> str:
-        """Extract video codec using ffprobe."""
+            stdout, _ = await asyncio.wait_for(probe.communicate(), timeout=10)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            probe.kill()
+            await probe.wait()
+            raise
+        
         try:
-            cmd = [
-                "ffprobe", "-v", "error", "-select_streams", "v:0",
-                "-show_entries", "stream=codec_name",
-                "-of", "json", self.file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            data = json.loads(result.stdout)
-            if data.get("streams"):
-                return data["streams"][0].get("codec_name", "h264")
-            return "h264"
-        except Exception as e:
-            logger.warning(f"Could not get codec: {e}")
-            return "h264"
-    
-    def _check_audio(self) -> bool:
-        """Check if video has audio stream."""
+            meta.apply_probe(json.loads(stdout or b"{}"))
+        except ValueError as e:
+            logger.warning("Could not parse ffprobe output for %s: %s", file_name, e)
+        return meta
+    
+    def apply_probe(self, data: Dict) -> None:
+        """Update metadata from `ffprobe -show_streams -show_format -of json` output."""
+        streams = data.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), None)
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+        
         try:
-            cmd = [
-                "ffprobe", "-v", "error", "-select_streams", "a:0",
-                "-show_entries", "stream=codec_type",
-                "-of", "json", self.file_path
-            ]
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            data = json.loads(result.stdout)
-            return len(data.get("streams", [])) > 0
-        except Exception as e:
-            logger.warning(f"Could not check audio: {e}")
-            return True
+            self.duration = float(data.get("format", {}).get("duration") or (video or {}).get("duration") or 0)
+        except ValueError:
+            self.duration = 0.0
+        
+        if video:
+            self.codec = video.get("codec_name", self.codec)
+            self.resolution = (video.get("width", self.resolution[0]), video.get("height", self.resolution[1]))
+            self.pix_fmt = video.get("pix_fmt")
+            fps_str = video.get("r_frame_rate", "")
+            try:
+                num, _, den = fps_str.partition("/")
+                self.fps = float(num) / float(den or 1)
+            except (ValueError, ZeroDivisionError):
+                pass
+        
+        self.has_audio = audio is not None
+        if audio:
+            self.audio_codec = audio.get("codec_name")
+            try:
+                self.sample_rate = int(audio.get("sample_rate", 0)) or None
+            except ValueError:
+                self.sample_rate = None
+    
+    @property
+    def stream_signature(self) -> tuple:
+        """Stream parameters that must match across videos for a stream-copy merge."""
+        return (
+            self.codec,
+            self.audio_codec,
+            self.resolution,
+            round(self.fps, 3),
+            self.sample_rate,
+            self.pix_fmt,
+            self.has_audio,
+        )
     
     def to_dict(self) -> Dict:
         """Convert to dictionary for storage."""
@@ -119,6 +118,9 @@ class VideoMetadata:
             "fps": self.fps,
             "codec": self.codec,
             "has_audio": self.has_audio,
+            "audio_codec": self.audio_codec,
+            "sample_rate": self.sample_rate,
+            "pix_fmt": self.pix_fmt,
             "added_time": self.added_time.isoformat(),
         }
     
@@ -130,6 +132,9 @@ class VideoMetadata:
         meta.fps = data.get("fps", 0.0)
         meta.codec = data.get("codec", "unknown")
         meta.has_audio = data.get("has_audio", False)
+        meta.audio_codec = data.get("audio_codec")
+        meta.sample_rate = data.get("sample_rate")
+        meta.pix_fmt = data.get("pix_fmt")
         meta.size = data.get("size", 0)
         meta.duration = data.get("duration", 0)
         meta.added_time = datetime.fromisoformat(data.get("added_time", datetime.now().isoformat()))
@@ -143,6 +148,8 @@ class MergeQueue:
         self.user_id = user_id
         self.videos: List[VideoMetadata] = []
         self.queue_message_id: Optional[int] = None  # Track single message ID for editing
+        self._total_duration = 0.0  # Running sum, kept in step with self.videos
+        self.merging = False  # Set while a merge of this queue is running
         self.settings = {
             "merge_mode": "smart",  # smart, fast, safe
             "resolution": "auto",    # auto, 720, 1080, 4k
@@ -162,12 +169,17 @@ class MergeQueue:
             return False
         
         self.videos.append(metadata)
+        self._total_duration += metadata.duration
         return True
     
     def remove_video(self, index: int) -> bool:
         """Remove video at index."""
+        if self.merging:
+            logger.warning("User %s tried to remove a video during a merge", self.user_id)
+            return False
         if 0 <= index < len(self.videos):
             video = self.videos.pop(index)
+            self._total_duration -= video.duration
             file_manager.delete_file(video.file_path)
             return True
         return False
@@ -184,6 +196,7 @@ class MergeQueue:
         for video in self.videos:
             file_manager.delete_file(video.file_path)
         self.videos = []
+        self._total_duration = 0.0
         self.queue_message_id = None
     
     def get_total_size(self) -> float:
@@ -193,7 +206,11 @@ class MergeQueue:
     
     def get_total_duration(self) -> float:
         """Get total duration in seconds."""
-        return sum(v.duration for v in self.videos)
+        return self._total_duration
+    
+    def can_stream_copy(self) -> bool:
+        """Check whether all videos share codecs and parameters for `-c copy`."""
+        return len(set(v.stream_signature for v in self.videos)) <= 1
     
     def get_validation_warnings(self) -> List[str]:
         """Check for codec/resolution mismatches."""
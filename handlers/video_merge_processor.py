@@ -2,18 +2,330 @@
 import logging
 import os
 import asyncio
+import collections
+import shutil
+import tempfile
 import time
-import subprocess
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from contextlib import asynccontextmanager
+from aiolimiter import AsyncLimiter
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 from utils.file_manager import FileManager
 from utils.ffmpeg_processor import FFmpegProcessor
-from handlers.video_merge_manager import get_or_create_queue
+from handlers.video_merge_manager import get_or_create_queue, MergeQueue
 
 logger = logging.getLogger(__name__)
 file_manager = FileManager()
 processor = FFmpegProcessor()
 
+# Minimum seconds between progress edits of the merge status message
+PROGRESS_EDIT_INTERVAL = 3.0
+
+# Merges are killed if ffmpeg runs longer than this (seconds)
+MERGE_TIMEOUT = 3600
+
+# Only the last lines of ffmpeg/rclone stderr are kept, so memory stays bounded
+# however long or noisy the process is
+STDERR_TAIL_LINES = 512
+
+# The concat-protocol path remuxes every input to a temporary .ts copy first, so
+# it only pays off for small batches where per-file MP4 parsing dominates
+CONCAT_PROTOCOL_MAX_BYTES = 512 * 1024 * 1024
+
+# Remux ffmpegs one concat-protocol merge may run at once (it holds a single merge slot)
+CONCAT_REMUX_PARALLELISM = 2
+
+# How long rclone may keep uploading after ffmpeg finishes a streamed merge (seconds)
+RCLONE_STREAM_TIMEOUT = 1800
+
+# Merged outputs smaller than this are treated as corrupt or empty (bytes)
+MIN_OUTPUT_BYTES = 1024
+
+# Queue keyboards are immutable, so build them once instead of per added video
+_QUEUE_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("➕ Add More", callback_data="merge_add_video")],
+    [
+        InlineKeyboardButton("▶️ Merge", callback_data="merge_confirm"),
+        InlineKeyboardButton("❌ Cancel", callback_data="merge_clear"),
+        InlineKeyboardButton("🔙 Back", callback_data="merge_menu"),
+    ],
+])
+
+# Bot-wide cap on status edits, kept below Telegram's ~30 requests/sec limit
+EDIT_LIMITER = AsyncLimiter(25, 1)
+
+# ffmpeg already runs out of process; cap how many run at once. A fixed default
+# rather than os.cpu_count(), which reports the host's cores inside a container,
+# and libx264 re-encodes use every core on their own anyway
+MAX_CONCURRENT_MERGES = int(os.getenv("MAX_CONCURRENT_MERGES", 4))
+merge_slots = asyncio.Semaphore(MAX_CONCURRENT_MERGES)
+
+
+async def _edit_status(context, text: str) -> None:
+    """Edit the user's merge status message through the shared rate limiter.
+    
+    The message is addressed by the (chat_id, message_id) stored in user_data,
+    so edits keep working even without the original Message object. Nothing is
+    edited once the merge that owns the message has finished.
+    """
+    status_ids = context.user_data.get("merge_status_msg")
+    if status_ids is None:
+        return
+    chat_id, message_id = status_ids
+    async with EDIT_LIMITER:
+        await context.bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id)
+
+
+@asynccontextmanager
+async def merge_workspace(user_id: int):
+    """Yield a private temp directory for one merge and always remove it afterwards."""
+    # Dedicated directory per merge so concurrent users never share output paths
+    workdir = await asyncio.to_thread(tempfile.mkdtemp, prefix=f"merge_{user_id}_", dir=file_manager.TEMP_FOLDER)
+    try:
+        yield workdir
+    finally:
+        await asyncio.to_thread(shutil.rmtree, workdir, ignore_errors=True)
+
+
+async def _read_process_output(stream, on_progress=None, error_lines=None) -> None:
+    """Hand ffmpeg `-progress` blocks to on_progress and collect every other line."""
+    progress = {}
+    async for raw_line in stream:
+        line = raw_line.decode(errors="replace").rstrip()
+        key, sep, value = line.partition("=")
+        if on_progress and sep and key.replace("_", "").isalnum():
+            progress[key] = value
+            # ffmpeg emits "progress=continue|end" as the last key of every block
+            if key == "progress":
+                await on_progress(progress)
+        elif error_lines is not None:
+            error_lines.append(line)
+
+
+async def _run_ffmpeg(cmd: list, stdin_data: bytes = None, on_progress=None, stdout=None) -> tuple:
+    """Run ffmpeg as a native asyncio subprocess and return (returncode, stderr).
+    
+    Progress is read from stdout (`-progress pipe:1`), or from stderr
+    (`-progress pipe:2`) when stdout is redirected to the given file descriptor.
+    """
+    redirected = stdout is not None
+    if not redirected:
+        stdout = asyncio.subprocess.PIPE if on_progress else asyncio.subprocess.DEVNULL
+    
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+        stdout=stdout,
+        stderr=asyncio.subprocess.PIPE
+    )
+    if stdin_data is not None:
+        process.stdin.write(stdin_data)
+        process.stdin.close()
+    
+    error_lines = collections.deque(maxlen=STDERR_TAIL_LINES)
+    pending = [
+        process.wait(),
+        _read_process_output(process.stderr, on_progress if redirected else None, error_lines),
+    ]
+    if on_progress and not redirected:
+        pending.append(_read_process_output(process.stdout, on_progress))
+    
+    try:
+        returncode, *_ = await asyncio.wait_for(asyncio.gather(*pending), timeout=MERGE_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        # Don't leave an orphaned ffmpeg behind when the merge times out or is cancelled
+        process.kill()
+        await process.wait()
+        raise
+    return returncode, "\n".join(error_lines)
+
+
+async def _stream_merge_to_rclone(cmd: list, stdin_data: bytes, progress, conf_path: str, drive_name: str, filename: str) -> tuple:
+    """Pipe ffmpeg's output straight into `rclone rcat` so merging and uploading overlap.
+    
+    Returns (ffmpeg returncode, ffmpeg stderr, upload result dict). The result
+    has "aborted" set when rclone was killed because the merge itself failed
+    or came out too small, rather than failing on its own.
+    """
+    read_fd, write_fd = os.pipe()
+    try:
+        rclone = await asyncio.create_subprocess_exec(
+            "rclone", "rcat", f"--config={conf_path}", f"{drive_name}:/{filename}",
+            stdin=read_fd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except BaseException:
+        os.close(write_fd)
+        raise
+    finally:
+        os.close(read_fd)
+    
+    rclone_errors = collections.deque(maxlen=STDERR_TAIL_LINES)
+    rclone_output = asyncio.ensure_future(_read_process_output(rclone.stderr, error_lines=rclone_errors))
+    
+    def kill_rclone() -> bool:
+        if rclone.returncode is not None:
+            return False
+        try:
+            rclone.kill()
+            return True
+        except ProcessLookupError:
+            return False  # rclone already exited on its own (bad auth, missing remote...)
+    
+    try:
+        returncode, stderr = await _run_ffmpeg(cmd, stdin_data, progress.update, stdout=write_fd)
+    except BaseException:
+        # ffmpeg timed out or the merge was cancelled: reap rclone and its stderr
+        # reader before re-raising so neither outlives the merge
+        kill_rclone()
+        os.close(write_fd)
+        rclone_output.cancel()
+        await asyncio.gather(rclone_output, rclone.wait(), return_exceptions=True)
+        raise
+    
+    # Kill rclone before it sees EOF so a failed or empty merge never lands as an upload
+    killed = False
+    if returncode != 0 or progress.written_bytes < MIN_OUTPUT_BYTES:
+        killed = kill_rclone()
+    os.close(write_fd)
+    
+    try:
+        await asyncio.wait_for(asyncio.gather(rclone_output, rclone.wait()), timeout=RCLONE_STREAM_TIMEOUT)
+    except asyncio.TimeoutError:
+        rclone.kill()
+        await rclone.wait()
+        return returncode, stderr, {"success": False, "error": "Upload timeout"}
+    
+    if rclone.returncode != 0:
+        if killed and not rclone_errors:
+            return returncode, stderr, {"success": False, "error": "Merge failed", "aborted": True}
+        error = "\n".join(list(rclone_errors)[-5:]) or "Rclone upload failed"
+        logger.error("Rclone rcat failed with code %s: %s", rclone.returncode, error)
+        return returncode, stderr, {"success": False, "error": error}
+    
+    return returncode, stderr, {"success": True, "remote": drive_name, "file": filename}
+
+
+def _can_use_concat_protocol(queue) -> bool:
+    """Check if the batch is small, uniform H.264/AAC MP4 suitable for the concat protocol."""
+    if not queue.can_stream_copy():
+        return False
+    if sum(v.size for v in queue.videos) > CONCAT_PROTOCOL_MAX_BYTES:
+        return False
+    return all(
+        v.codec == "h264"
+        and v.audio_codec in ("aac", None)
+        and os.path.splitext(v.file_path)[1].lower() in (".mp4", ".m4v", ".mov")
+        for v in queue.videos
+    )
+
+
+async def _merge_with_concat_protocol(queue, workdir: str, output_file: str, on_progress) -> tuple:
+    """Remux inputs to MPEG-TS a few at a time, then join them with `concat:` without reparsing MP4 headers."""
+    ts_files = [os.path.join(workdir, f"part_{idx}.ts") for idx in range(len(queue.videos))]
+    
+    remux_slots = asyncio.Semaphore(CONCAT_REMUX_PARALLELISM)
+    
+    async def remux(video, ts_file):
+        async with remux_slots:
+            return await _run_ffmpeg([
+                "ffmpeg", "-y", "-hide_banner", "-loglevel", "error",
+                "-i", video.file_path,
+                "-map", "0:v:0",
+                "-map", "0:a?",
+                "-c", "copy",
+                "-bsf:v", "h264_mp4toannexb",
+                "-f", "mpegts",
+                ts_file
+            ])
+    
+    try:
+        remux_results = await asyncio.gather(*(
+            remux(video, ts_file) for video, ts_file in zip(queue.videos, ts_files)
+        ))
+        for returncode, stderr in remux_results:
+            if returncode != 0:
+                return returncode, stderr
+        
+        cmd = [
+            "ffmpeg",
+            "-y",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-i", "concat:" + "|".join(ts_files),
+            "-map", "0:v:0",
+            "-map", "0:a?",
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+            "-movflags", "+faststart",
+            "-progress", "pipe:1",
+            "-nostats",
+            output_file
+        ]
+        return await _run_ffmpeg(cmd, on_progress=on_progress)
+    finally:
+        # Drop the intermediate copies before the upload starts
+        for ts_file in ts_files:
+            await asyncio.to_thread(file_manager.delete_file, ts_file)
+
+
+def _build_concat_filter_cmd(videos) -> list:
+    """Build a concat-filter re-encode for videos whose streams don't match.
+    
+    Every clip is scaled/padded to the first clip's resolution and frame rate
+    and its audio is brought to one sample rate, since the concat filter needs
+    identical stream parameters on every segment. Clips without audio get a
+    silent track of their own duration so the segments still line up.
+    """
+    first = videos[0]
+    width, height = first.resolution
+    fps = round(first.fps, 3) if first.fps else 30
+    sample_rate = first.sample_rate or 48000
+    with_audio = any(v.has_audio for v in videos)
+    
+    video_filter = (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps}"
+    )
+    audio_format = f"aformat=sample_rates={sample_rate}:channel_layouts=stereo"
+    
+    inputs = []
+    filters = []
+    segments = []
+    for idx, video in enumerate(videos):
+        inputs += ["-i", video.file_path]
+        filters.append(f"[{idx}:v]{video_filter}[v{idx}]")
+        segments.append(f"[v{idx}]")
+        if not with_audio:
+            continue
+        if video.has_audio:
+            filters.append(f"[{idx}:a]{audio_format}[a{idx}]")
+        else:
+            filters.append(
+                f"anullsrc=r={sample_rate}:cl=stereo,atrim=duration={video.duration},{audio_format}[a{idx}]"
+            )
+        segments.append(f"[a{idx}]")
+    
+    outputs = "[v][a]" if with_audio else "[v]"
+    filters.append(f"{''.join(segments)}concat=n={len(videos)}:v=1:a={int(with_audio)}{outputs}")
+    
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-hide_banner",
+        "-loglevel", "error",
+        *inputs,
+        "-filter_complex", ";".join(filters),
+        "-map", "[v]",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+    ]
+    if with_audio:
+        cmd += ["-map", "[a]", "-c:a", "aac"]
+    return cmd
+
 
 async def process_merge_video(update: Update, context: ContextTypes.DEFAULT_TYPE, filepath: str) -> None:
     """Handle video addition to merge queue - ONLY updates queue message, no extra messages."""
@@ -21,7 +333,16 @@ async def process_merge_video(update: Update, context: ContextTypes.DEFAULT_TYPE
         user_id = update.effective_user.id
         queue = get_or_create_queue(user_id)
         
-        if not os.path.exists(filepath):
+        # Anything added now would be deleted unmerged by the running merge's cleanup
+        if queue.merging:
+            await update.message.reply_text(
+                "⏳ Merge already running!",
+                reply_to_message_id=update.message.message_id
+            )
+            await asyncio.to_thread(file_manager.delete_file, filepath)
+            return
+        
+        if not await asyncio.to_thread(os.path.exists, filepath):
             await update.message.reply_text(
                 "❌ File not found",
                 reply_to_message_id=update.message.message_id
@@ -33,53 +354,54 @@ async def process_merge_video(update: Update, context: ContextTypes.DEFAULT_TYPE
         from handlers.video_merge_manager import VideoMetadata
         
         try:
-            metadata = VideoMetadata(
+            # One async ffprobe fills in duration and every stream detail the merge needs
+            metadata = await VideoMetadata.from_file(
                 msg_id=update.message.message_id,
                 file_name=os.path.basename(filepath),
                 file_path=filepath
             )
         except Exception as e:
-            logger.error(f"Error extracting metadata: {e}")
+            logger.error("Error extracting metadata: %s", e)
             await update.message.reply_text(
                 f"❌ Cannot read video file: {str(e)}"
             )
-            file_manager.delete_file(filepath)
+            await asyncio.to_thread(file_manager.delete_file, filepath)
             context.user_data["operation"] = None
             return
         
         # Add to queue
         if queue.add_video(metadata):
-            keyboard = [
-                [InlineKeyboardButton("➕ Add More", callback_data="merge_add_video")],
-                [
-                    InlineKeyboardButton("▶️ Merge", callback_data="merge_confirm"),
-                    InlineKeyboardButton("❌ Cancel", callback_data="merge_clear"),
-                    InlineKeyboardButton("🔙 Back", callback_data="merge_menu"),
-                ],
-            ]
-            
             queue_text = f"✅ Video added!\n\n{queue.format_queue_message()}\n\nAdd more videos or start merge?"
             
-            if len(queue.videos) == 1:
-                msg = await update.message.reply_text(
-                    text=queue_text,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
-                )
-                queue.queue_message_id = msg.message_id
-            else:
-                if queue.queue_message_id:
-                    try:
-                        await context.bot.delete_message(
-                            chat_id=user_id,
-                            message_id=queue.queue_message_id
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not delete old message: {e}")
-                
-                # Send fresh message
+            send_fresh = len(queue.videos) == 1 or not queue.queue_message_id
+            
+            if not send_fresh:
+                # One edit instead of delete + send halves the API calls per video
+                try:
+                    await context.bot.edit_message_text(
+                        chat_id=user_id,
+                        message_id=queue.queue_message_id,
+                        text=queue_text,
+                        reply_markup=_QUEUE_KEYBOARD
+                    )
+                except TelegramError as e:
+                    # Fall back to delete + send on any failure (RetryAfter, TimedOut,
+                    # NetworkError...) so a queued video is never reported as an error
+                    if "message is not modified" not in str(e).lower():
+                        logger.warning("Could not edit queue message: %s", e)
+                        send_fresh = True
+                        try:
+                            await context.bot.delete_message(
+                                chat_id=user_id,
+                                message_id=queue.queue_message_id
+                            )
+                        except Exception as e:
+                            logger.warning("Could not delete old message: %s", e)
+            
+            if send_fresh:
                 msg = await update.message.reply_text(
                     text=queue_text,
-                    reply_markup=InlineKeyboardMarkup(keyboard)
+                    reply_markup=_QUEUE_KEYBOARD
                 )
                 queue.queue_message_id = msg.message_id
         else:
@@ -91,7 +413,7 @@ async def process_merge_video(update: Update, context: ContextTypes.DEFAULT_TYPE
         context.user_data["operation"] = None
     
     except Exception as e:
-        logger.error(f"Error processing merge video: {e}")
+        logger.error("Error processing merge video: %s", e)
         await update.message.reply_text(f"❌ Error: {str(e)}")
         context.user_data["operation"] = None
 
@@ -105,21 +427,25 @@ async def execute_smart_merge(update: Update, context: ContextTypes.DEFAULT_TYPE
     upload_mode = context.user_data.get("upload_mode")
     if not upload_mode:
         await query.answer("❌ Please select Upload Mode first!", show_alert=True)
-        logger.warning(f"User {user_id} attempted merge without selecting upload mode")
+        logger.warning("User %s attempted merge without selecting upload mode", user_id)
         return
     
     if upload_mode.get("engine") == "telegram" and "format" not in upload_mode:
         await query.answer("❌ Please select format (Video/Document)!", show_alert=True)
-        logger.warning(f"User {user_id} attempted merge without selecting Telegram format")
+        logger.warning("User %s attempted merge without selecting Telegram format", user_id)
         return
     
     if len(queue.videos) < 2:
         await query.answer("Need at least 2 videos!", show_alert=True)
         return
     
-    status_msg = None
-    concat_file = None
-    output_file = None
+    # Updates are handled concurrently, so a repeated Merge tap must not start a
+    # second merge that reads inputs the first one is about to delete
+    if queue.merging:
+        await query.answer("⏳ Merge already running!", show_alert=True)
+        return
+    queue.merging = True
+    status_ids = None
     
     try:
         start_time = time.time()
@@ -134,7 +460,7 @@ async def execute_smart_merge(update: Update, context: ContextTypes.DEFAULT_TYPE
                      "📊 Progress: 0%"
             )
         except Exception as e:
-            logger.error(f"Could not edit message: {e}")
+            logger.error("Could not edit message: %s", e)
             # Fallback: create new message if edit fails
             status_msg = await context.bot.send_message(
                 chat_id=user_id,
@@ -142,240 +468,357 @@ async def execute_smart_merge(update: Update, context: ContextTypes.DEFAULT_TYPE
                      "⏳ Stage 1: Preparing Files\n"
                      "📊 Progress: 0%"
             )
+        status_ids = (status_msg.chat_id, status_msg.message_id)
+        context.user_data["merge_status_msg"] = status_ids
         
         await asyncio.sleep(0.5)
         
-        # Stage 1: Create concat file
-        concat_file = os.path.join(file_manager.TEMP_FOLDER, "concat_list.txt")
-        with open(concat_file, "w", encoding="utf-8") as f:
-            for video in queue.videos:
-                abs_path = os.path.abspath(video.file_path).replace("\\", "/")
-                f.write(f"file '{abs_path}'\n")
+        # Stage 1: Build concat list (fed to ffmpeg over stdin, never written to disk)
+        concat_bytes = "".join(
+            f"file '{video.abs_posix_path}'\n" for video in queue.videos
+        ).encode("utf-8")
         
-        total_size_mb = sum(os.path.getsize(v.file_path) / (1024 * 1024) for v in queue.videos)
+        # Sizes were stat'ed once when each video was queued
+        total_size_mb = sum(v.size for v in queue.videos) / (1024 * 1024)
         total_duration = queue.get_total_duration()
-        output_file = os.path.join(file_manager.TEMP_FOLDER, merged_filename)
         
-        try:
-            await status_msg.edit_text(
-                text="🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
-                     "✅ Stage 1: Files Ready\n"
-                     "⏳ Stage 2: Merging (FAST - Stream Copy)\n\n"
-                     "📊 Progress: 5%\n"
-                     f"📁 Total Size: {total_size_mb:.2f}MB\n"
-                     "⏱️ ETA: Calculating..."
-            )
-        except Exception as e:
-            logger.warning(f"Could not update status: {e}")
-        
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-hide_banner",
-            "-loglevel", "error",
-            "-f", "concat",
-            "-safe", "0",
-            "-fflags", "+genpts",
-            "-i", concat_file,
-            "-map", "0:v:0",
-            "-map", "0:a?",
-            "-c", "copy",
-            "-movflags", "+faststart",
-            output_file
-        ]
-        
-        # Run FFmpeg in thread to avoid blocking async event loop
-        def run_ffmpeg():
-            return subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=3600
-            )
-        
-        process_result = await asyncio.to_thread(run_ffmpeg)
-        
-        # Check if merge succeeded
-        if process_result.returncode != 0:
-            logger.error(f"FFmpeg merge failed with return code: {process_result.returncode}")
-            logger.error(f"FFmpeg stderr: {process_result.stderr}")
+        async with merge_workspace(user_id) as workdir:
+            output_file = os.path.join(workdir, merged_filename)
+            
+            upload_engine = upload_mode.get("engine", "telegram")
+            use_concat_protocol = _can_use_concat_protocol(queue)
+            
+            # For rclone, stream the merged output straight into the upload instead of
+            # writing it to disk first (fragmented MP4, since the pipe is not seekable)
+            stream_remote = None
+            if upload_engine == "rclone" and not use_concat_protocol:
+                from handlers.rclone_upload import get_rclone_remote
+                stream_remote = await asyncio.to_thread(get_rclone_remote, user_id)
+            
+            # Stream copy only works when every input shares codecs and parameters;
+            # otherwise go straight to re-encoding instead of producing a broken file
+            stream_copy = queue.can_stream_copy()
+            merge_label = "FAST - Stream Copy" if stream_copy else "Re-encoding"
             
             try:
-                await status_msg.edit_text(
-                    text="❌ MERGE FAILED\n━━━━━━━━━━━━━━━━━━\n\n"
-                         "Error: Check if videos have compatible formats.\n"
-                         "Try converting to same format first."
+                await _edit_status(
+                    context,
+                    text="🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
+                         "✅ Stage 1: Files Ready\n"
+                         f"⏳ Stage 2: Merging ({merge_label})\n\n"
+                         "📊 Progress: 5%\n"
+                         f"📁 Total Size: {total_size_mb:.2f}MB\n"
+                         "⏱️ ETA: Calculating..."
                 )
-            except:
-                pass
+            except Exception as e:
+                logger.warning("Could not update status: %s", e)
             
-            # Cleanup
-            try:
-                if concat_file and os.path.exists(concat_file):
-                    os.remove(concat_file)
-                if output_file and os.path.exists(output_file):
-                    os.remove(output_file)
-            except:
-                pass
-            return
-        
-        if not os.path.exists(output_file) or os.path.getsize(output_file) < 1024:
-            logger.error(f"Output file missing or too small: {output_file}")
-            try:
-                await status_msg.edit_text(
-                    text="❌ MERGE FAILED\n━━━━━━━━━━━━━━━━━━\n\n"
-                         "Error: Output file corrupted or empty.\n"
-                         "Ensure videos are valid MP4 files."
+            if stream_copy:
+                cmd = [
+                    "ffmpeg",
+                    "-y",
+                    "-hide_banner",
+                    "-loglevel", "error",
+                    "-f", "concat",
+                    "-safe", "0",
+                    "-protocol_whitelist", "pipe,file",
+                    "-fflags", "+genpts",
+                    "-i", "-",
+                    "-map", "0:v:0",
+                    "-map", "0:a?",
+                    "-c", "copy",
+                ]
+                stdin_data = concat_bytes
+            else:
+                # The concat demuxer applies the first file's codec parameters to every
+                # input, so mismatched batches go through the concat filter instead
+                cmd = _build_concat_filter_cmd(queue.videos)
+                stdin_data = None
+            if stream_remote:
+                cmd += [
+                    "-f", "mp4",
+                    "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+                    "-progress", "pipe:2",
+                    "-nostats",
+                    "pipe:1"
+                ]
+            else:
+                cmd += [
+                    "-movflags", "+faststart",
+                    "-progress", "pipe:1",
+                    "-nostats",
+                    output_file
+                ]
+            
+            if merge_slots.locked():
+                try:
+                    await _edit_status(
+                        context,
+                        text="🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
+                             "✅ Stage 1: Files Ready\n"
+                             "⏳ Waiting for a free merge slot..."
+                    )
+                except Exception as e:
+                    logger.warning("Could not update status: %s", e)
+            
+            progress = MergeProgress(context, merge_label, total_duration, total_size_mb)
+            upload_result = None
+            
+            async with merge_slots:
+                returncode = None
+                if use_concat_protocol:
+                    returncode, stderr = await _merge_with_concat_protocol(
+                        queue, workdir, output_file, progress.update
+                    )
+                    if returncode != 0:
+                        logger.warning(
+                            "Concat protocol merge failed (%s), falling back to concat demuxer: %s",
+                            returncode, stderr[-4096:]
+                        )
+                
+                if returncode != 0:
+                    if stream_remote:
+                        returncode, stderr, upload_result = await _stream_merge_to_rclone(
+                            cmd, stdin_data, progress, *stream_remote, merged_filename
+                        )
+                    else:
+                        returncode, stderr = await _run_ffmpeg(cmd, stdin_data, progress.update)
+            
+            # When rclone gave up on its own, ffmpeg only failed on the broken pipe
+            if upload_result is not None and not upload_result["success"] and not upload_result.get("aborted"):
+                logger.error("Streamed rclone upload failed: %s", upload_result["error"])
+                try:
+                    await _edit_status(context, f"❌ Rclone upload failed:\n{upload_result['error']}")
+                except TelegramError:
+                    pass
+                
+                return
+            
+            # Check if merge succeeded
+            if returncode != 0:
+                logger.error("FFmpeg merge failed with return code: %s", returncode)
+                logger.error("FFmpeg stderr: %s", stderr[-4096:])
+                
+                try:
+                    await _edit_status(
+                        context,
+                        text="❌ MERGE FAILED\n━━━━━━━━━━━━━━━━━━\n\n"
+                             "Error: Check if videos have compatible formats.\n"
+                             "Try converting to same format first."
+                    )
+                except TelegramError:
+                    pass
+                
+                return
+            
+            if stream_remote:
+                output_size = progress.written_bytes
+            else:
+                try:
+                    output_size = (await asyncio.to_thread(os.stat, output_file)).st_size
+                except OSError:
+                    output_size = 0
+            
+            if output_size < MIN_OUTPUT_BYTES:
+                logger.error("Output file missing or too small: %s", output_file)
+                try:
+                    await _edit_status(
+                        context,
+                        text="❌ MERGE FAILED\n━━━━━━━━━━━━━━━━━━\n\n"
+                             "Error: Output file corrupted or empty.\n"
+                             "Ensure videos are valid MP4 files."
+                    )
+                except TelegramError:
+                    pass
+                
+                return
+            
+            file_size_mb = output_size / (1024 * 1024)
+            
+            if upload_result is None:
+                try:
+                    await _edit_status(
+                        context,
+                        text="🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
+                             "✅ Stage 1: Files Ready\n"
+                             "✅ Stage 2: Merge Complete\n"
+                             "⏳ Stage 3: Uploading\n\n"
+                             "📊 Progress: 95%"
+                    )
+                except TelegramError:
+                    pass
+            
+            if upload_engine == "telegram":
+                upload_as_document = upload_mode.get("format") == "document"
+                await _upload_to_telegram(
+                    context, user_id, output_file, file_size_mb, 
+                    total_duration, start_time, upload_as_document, merged_filename
                 )
-            except:
-                pass
+            elif upload_engine == "rclone":
+                await _upload_to_rclone(
+                    context, user_id, output_file, file_size_mb, queue, start_time, status_msg, merged_filename,
+                    result=upload_result
+                )
+            else:
+                logger.error("Unknown upload engine: %s", upload_engine)
+                await _edit_status(context, "❌ Invalid upload mode configured")
             
-            try:
-                if output_file and os.path.exists(output_file):
-                    os.remove(output_file)
-                if concat_file and os.path.exists(concat_file):
-                    os.remove(concat_file)
-            except:
-                pass
-            return
-        
-        file_size_mb = os.path.getsize(output_file) / (1024 * 1024)
-        
-        try:
-            await status_msg.edit_text(
-                text="🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
-                     "✅ Stage 1: Files Ready\n"
-                     "✅ Stage 2: Merge Complete\n"
-                     "⏳ Stage 3: Uploading\n\n"
-                     "📊 Progress: 95%"
-            )
-        except:
-            pass
-        
-        upload_engine = upload_mode.get("engine", "telegram")
-        
-        if upload_engine == "telegram":
-            upload_as_document = upload_mode.get("format") == "document"
-            await _upload_to_telegram(
-                context, user_id, output_file, file_size_mb, 
-                queue, start_time, status_msg, upload_as_document, merged_filename
-            )
-        elif upload_engine == "rclone":
-            await _upload_to_rclone(
-                context, user_id, output_file, queue, start_time, status_msg, merged_filename
-            )
-        else:
-            logger.error(f"Unknown upload engine: {upload_engine}")
-            await status_msg.edit_text("❌ Invalid upload mode configured")
-        
-        # Cleanup
-        queue.clear_all()
-        context.user_data.pop("merged_filename", None)
-        try:
-            if output_file and os.path.exists(output_file):
-                os.remove(output_file)
-            if concat_file and os.path.exists(concat_file):
-                os.remove(concat_file)
-        except:
-            pass
+            # Cleanup
+            await asyncio.to_thread(queue.clear_all)
+            context.user_data.pop("merged_filename", None)
     
     except Exception as e:
-        logger.error(f"Error executing merge: {e}", exc_info=True)
+        logger.error("Error executing merge: %s", e, exc_info=True)
         try:
-            if status_msg:
-                await status_msg.edit_text(f"❌ Merge error: {str(e)}")
+            if "merge_status_msg" in context.user_data:
+                await _edit_status(context, f"❌ Merge error: {str(e)}")
             else:
                 await context.bot.send_message(
                     chat_id=user_id,
                     text=f"❌ Merge error: {str(e)}"
                 )
         except Exception as edit_error:
-            logger.error(f"Could not send error message: {edit_error}")
-        
-        # Cleanup on error
+            logger.error("Could not send error message: %s", edit_error)
+    
+    finally:
+        # Leave the key alone if another merge has since stored its own message
+        if status_ids is not None and context.user_data.get("merge_status_msg") == status_ids:
+            context.user_data.pop("merge_status_msg", None)
+        queue.merging = False
+
+
+class MergeProgress:
+    """Turn ffmpeg `-progress` blocks into throttled merge status edits."""
+    
+    def __init__(self, context, merge_label: str, total_duration: float, total_size_mb: float):
+        self.context = context
+        self.merge_label = merge_label
+        self.total_duration = total_duration
+        self.total_size_mb = total_size_mb
+        self.written_bytes = 0
+        self._started = time.monotonic()
+        self._last_edit = 0.0
+        self._last_text = None
+    
+    async def update(self, progress: dict) -> None:
+        """Record one progress block and edit the status message if due."""
         try:
-            if concat_file and os.path.exists(concat_file):
-                os.remove(concat_file)
-            if output_file and os.path.exists(output_file):
-                os.remove(output_file)
-        except:
+            self.written_bytes = int(progress.get("total_size", 0))
+        except ValueError:
             pass
+        
+        if self.total_duration <= 0:
+            return
+        
+        now = time.monotonic()
+        if now - self._last_edit < PROGRESS_EDIT_INTERVAL:
+            return
+        
+        try:
+            # out_time_ms is reported in microseconds as well on older ffmpeg builds
+            out_time_us = int(progress.get("out_time_us") or progress.get("out_time_ms"))
+        except (TypeError, ValueError):
+            return
+        
+        fraction = min(max(out_time_us / (self.total_duration * 1_000_000), 0.0), 1.0)
+        elapsed = now - self._started
+        eta = f"{int(elapsed * (1 - fraction) / fraction)}s" if fraction > 0 else "Calculating..."
+        
+        text = (
+            "🔀 MERGING VIDEOS\n━━━━━━━━━━━━━━━━━━\n\n"
+            "✅ Stage 1: Files Ready\n"
+            f"⏳ Stage 2: Merging ({self.merge_label})\n\n"
+            f"📊 Progress: {5 + int(fraction * 90)}%\n"
+            f"📁 Written: {self.written_bytes / (1024 * 1024):.2f}MB / {self.total_size_mb:.2f}MB\n"
+            f"⏱️ ETA: {eta}"
+        )
+        if text == self._last_text:
+            return
+        
+        self._last_edit = now
+        self._last_text = text
+        try:
+            await _edit_status(self.context, text)
+        except Exception as e:
+            logger.warning("Could not update merge progress: %s", e)
 
 
-async def _upload_to_telegram(context, user_id, filepath, file_size_mb, queue, start_time, status_msg, upload_as_document, filename):
+async def _upload_to_telegram(context, user_id, filepath, file_size_mb, total_duration, start_time, upload_as_document, filename):
     """Upload file to Telegram using selected format (video or document)."""
+    caption = (
+        f"✅ MERGE COMPLETE!\n━━━━━━━━━━━━━━━━━━\n\n"
+        f"{'📁' if upload_as_document else '📹'} {filename}\n"
+        f"📊 Size: {file_size_mb:.2f}MB\n"
+        f"⏱️ Duration: {MergeQueue._format_duration(total_duration)}\n\n"
+        f"⏲️ Processing time: {int(time.time() - start_time)}s"
+    )
+    
     try:
+        # read_file_handle=False lets the HTTP transport stream the file in chunks
+        # instead of loading the whole merged video into memory first
         with open(filepath, 'rb') as f:
+            media = InputFile(f, filename=filename, read_file_handle=False)
             if upload_as_document:
-                await context.bot.send_document(
-                    chat_id=user_id,
-                    document=f,
-                    caption=f"✅ MERGE COMPLETE!\n━━━━━━━━━━━━━━━━━━\n\n"
-                            f"📁 {filename}\n"
-                            f"📊 Size: {file_size_mb:.2f}MB\n"
-                            f"⏱️ Duration: {queue._format_duration(queue.get_total_duration())}\n\n"
-                            f"⏲️ Processing time: {int(time.time() - start_time)}s"
-                )
+                await context.bot.send_document(chat_id=user_id, document=media, caption=caption)
             else:
-                await context.bot.send_video(
-                    chat_id=user_id,
-                    video=f,
-                    caption=f"✅ MERGE COMPLETE!\n━━━━━━━━━━━━━━━━━━\n\n"
-                            f"📹 {filename}\n"
-                            f"📊 Size: {file_size_mb:.2f}MB\n"
-                            f"⏱️ Duration: {queue._format_duration(queue.get_total_duration())}\n\n"
-                            f"⏲️ Processing time: {int(time.time() - start_time)}s"
-                )
+                await context.bot.send_video(chat_id=user_id, video=media, caption=caption)
         
-        await status_msg.delete()
+        status_ids = context.user_data.get("merge_status_msg")
+        if status_ids is not None:
+            chat_id, message_id = status_ids
+            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
     except Exception as e:
-        logger.error(f"Telegram upload error: {e}")
+        logger.error("Telegram upload error: %s", e)
         raise
 
 
-async def _upload_to_rclone(context, user_id, filepath, queue, start_time, status_msg, filename):
-    """Upload file to Rclone configured drive."""
+async def _upload_to_rclone(context, user_id, filepath, file_size_mb, queue, start_time, status_msg, filename, result=None):
+    """Upload file to Rclone configured drive, or report a `result` already streamed there."""
     try:
         from handlers.rclone_upload import rclone_driver
         
-        result = await rclone_driver(status_msg, user_id, filepath, filename)
+        if result is None:
+            result = await rclone_driver(status_msg, user_id, filepath, filename)
         
         if result.get("success"):
             # Update final message with completion info
             try:
-                await status_msg.edit_text(
+                await _edit_status(
+                    context,
                     text=f"✅ MERGE & UPLOAD COMPLETE!\n━━━━━━━━━━━━━━━━━━\n\n"
                          f"📁 File: {filename}\n"
                          f"☁️ Remote: {result.get('remote', 'Unknown')}\n"
-                         f"📊 Size: {os.path.getsize(filepath)/(1024*1024):.2f}MB\n"
+                         f"📊 Size: {file_size_mb:.2f}MB\n"
                          f"⏱️ Total time: {int(time.time() - start_time)}s"
                 )
-            except:
+            except TelegramError:
                 pass
             
-            logger.info(f"Rclone upload successful for user {user_id}")
+            logger.info("Rclone upload successful for user %s", user_id)
         else:
             error_msg = result.get('error', 'Unknown error')
-            logger.error(f"Rclone upload failed: {error_msg}")
+            logger.error("Rclone upload failed: %s", error_msg)
             try:
-                await status_msg.edit_text(
+                await _edit_status(
+                    context,
                     f"❌ Rclone upload failed:\n{error_msg}"
                 )
-            except:
+            except TelegramError:
                 pass
         
     except ImportError as e:
-        logger.error(f"Rclone module import error: {e}")
+        logger.error("Rclone module import error: %s", e)
         try:
-            await status_msg.edit_text(
+            await _edit_status(
+                context,
                 "❌ Rclone handler not found.\n"
                 "Please ensure rclone module is installed."
             )
-        except:
+        except TelegramError:
             pass
     except Exception as e:
-        logger.error(f"Rclone upload error: {e}", exc_info=True)
+        logger.error("Rclone upload error: %s", e, exc_info=True)
         try:
-            await status_msg.edit_text(f"❌ Rclone upload failed: {str(e)}")
-        except:
+            await _edit_status(context, f"❌ Rclone upload failed: {str(e)}")
+        except TelegramError:
             pass
@@ -67,7 +67,8 @@ application = None
 async def on_startup():
     """Initialize bot and set webhook."""
     global application
-    application = Application.builder().token(BOT_TOKEN).build()
+    # Process up to 32 updates at once so a long merge doesn't stall other users
+    application = Application.builder().token(BOT_TOKEN).concurrent_updates(32).build()
     
     # Create temp folder for files
     FileManager.create_temp_folder()
@@ -75,7 +76,8 @@ async def on_startup():
     # Add command handlers
     application.add_handler(CommandHandler("start", start_command))
     
-    application.add_handler(CallbackQueryHandler(handle_callback_query))
+    # block=False: merge callbacks and uploads run in their own task
+    application.add_handler(CallbackQueryHandler(handle_callback_query, block=False))
     
     # Add legacy command handlers for backward compatibility
     application.add_handler(CommandHandler("merge", lambda u, c: merge_videos(u, c, MERGE_VIDEOS)))
@@ -93,11 +95,11 @@ async def on_startup():
     
     # Add file handler for all documents, videos, and audio
     application.add_handler(
-        MessageHandler(filters.Document.ALL | filters.VIDEO | filters.AUDIO, handle_files)
+        MessageHandler(filters.Document.ALL | filters.VIDEO | filters.AUDIO, handle_files, block=False)
     )
     
     application.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_files)
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_files, block=False)
     )
     
     async def error_handler(update, context):
@@ -135,7 +137,9 @@ async def telegram_webhook(request: Request):
     """Handle incoming Telegram updates via webhook."""
     try:
         update = Update.de_json(await request.json(), application.bot)
-        await application.process_update(update)
+        # Queue the update so the webhook returns immediately; the application's
+        # update fetcher dispatches it honouring concurrent_updates
+        await application.update_queue.put(update)
     except Exception as e:
         logger.error(f"Error processing webhook update: {e}")
     return {"ok": True}
@@ -35,11 +35,13 @@ class FFmpegProcessor:
         """Merge multiple videos using FFmpeg concat demuxer with production-ready flags."""
         try:
             concat_file = "concat.txt"
+            # Convert to absolute POSIX paths (forward slashes) and write the list in one call
+            lines = [
+                "file '{}'\n".format(os.path.abspath(video).replace("\\", "/"))
+                for video in video_paths
+            ]
             with open(concat_file, "w", encoding="utf-8") as f:
-                for video in video_paths:
-                    # Convert to absolute POSIX path (forward slashes)
-                    abs_path = os.path.abspath(video).replace("\\", "/")
-                    f.write(f"file '{abs_path}'\n")
+                f.write("".join(lines))
 
             # -fflags +genpts: Fixes broken timestamps on multi-file concat
             # -map 0:v:0 -map 0:a?: Properly maps video and optional audio streams